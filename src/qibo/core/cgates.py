@@ -270,9 +270,38 @@ class M(BackendGate, gates.M):
         x = K.einsum(self.traceout, K.reshape(state, shape))
         return K.cast(x, dtype='DTYPE')
 
+    def distributed_call(self, state):
+        """Calculates measured probabilities from the pieces of a distributed state.
+
+        The full state vector is not created. Instead the unmeasured local
+        qubits are summed in each piece and the unmeasured global qubits are
+        summed after stacking the reduced pieces.
+        """
+        qubits = state.qubits
+        targets = set(self.target_qubits)
+        unmeasured_local = tuple(qubits.reduced_local[q] for q in qubits.local
+                                 if q not in targets)
+        probs = []
+        for piece in state.pieces:
+            x = K.reshape(K.square(K.abs(piece)), state.nlocal * (2,))
+            probs.append(K.sum(x, axis=unmeasured_local))
+        # axes of the stacked probabilities are the global qubits followed by
+        # the measured local qubits
+        order = qubits.list + [q for q in qubits.local if q in targets]
+        probs = K.reshape(K.stack(probs), len(order) * (2,))
+        unmeasured_global = tuple(i for i, q in enumerate(qubits.list)
+                                  if q not in targets)
+        probs = K.sum(probs, axis=unmeasured_global)
+        # sort axes in increasing qubit order as in ``state_vector_call``
+        order = [q for q in order if q in targets]
+        return K.transpose(probs, axes=K.np.argsort(order))
+
     def sample(self, state, nshots):
         probs_dim = K.cast((2 ** len(self.target_qubits),), dtype='DTYPEINT')
-        probs = getattr(self, self._active_call)(state)
+        if isinstance(state, self.distutils.DistributedState):
+            probs = self.distributed_call(state)
+        else:
+            probs = getattr(self, self._active_call)(state)
         probs = K.transpose(probs, axes=self.reduced_target_qubits)
         probs = K.reshape(probs, probs_dim)
         samples_dec = K.sample_measurements(probs, nshots)
@@ -284,12 +313,12 @@ class M(BackendGate, gates.M):
         return result
 
     def __call__(self, state, nshots):
-        if isinstance(state, self.distutils.DistributedState):
-            with K.device(state.device):
-                state = state.vector
-
         if not self.is_prepared:
-            self.set_nqubits(state)
+            if isinstance(state, self.distutils.DistributedState):
+                self.nqubits = state.nqubits
+                self.prepare()
+            else:
+                self.set_nqubits(state)
 
         if math.log2(nshots) + len(self.target_qubits) > 31: # pragma: no cover
             # case not covered by GitHub workflows because it requires large example
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 # @authors: S. Efthymiou
 import math
-import joblib
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from qibo import K
 from qibo import gates as gate_module
 from qibo.abstractions import gates
@@ -65,6 +66,12 @@ class DistributedCircuit(circuit.Circuit):
         self.memory_device = memory_device
         self.calc_devices = accelerators
         self.queues = utils.DistributedQueues(self, gate_module)
+        # Thread pool used to run device jobs in parallel and one writer
+        # thread for each device that copies updated pieces to
+        # ``memory_device``, created for each execution (see ``_executors``)
+        # and reused for all gate groups
+        self._pool = None
+        self._writers = {}
 
     def set_nqubits(self, gate):
         AbstractCircuit.set_nqubits(self, gate)
@@ -116,10 +123,40 @@ class DistributedCircuit(circuit.Circuit):
         raise_error(RuntimeError, "Cannot compile circuit that uses custom operators.")
 
     def _device_job(self, state, gates):
+        # Device queues are executed eagerly: the custom operators update
+        # the state in place and cannot be lowered by XLA, so wrapping this
+        # loop in a ``tf.function`` would only add tracing for every group
         for gate in gates:
             state = gate(state)
         return state
 
+    @staticmethod
+    def _assign_piece(state: utils.DistributedState, device: str, i: int, piece):
+        """Assigns an updated piece to the state (runs in the device writer)."""
+        with K.device(device):
+            state.pieces[i].assign(piece)
+
+    @contextlib.contextmanager
+    def _executors(self):
+        """Creates the thread pools used by ``_joblib_execute``.
+
+        The pools are shared by all gate groups of a single execution and are
+        shut down when the execution finishes. Writers are only created for
+        devices that update more than one piece.
+        """
+        self._pool = ThreadPoolExecutor(max_workers=len(self.calc_devices))
+        self._writers = {device: ThreadPoolExecutor(max_workers=1)
+                         for device, ids in self.queues.device_to_ids.items()
+                         if len(ids) > 1}
+        try:
+            yield
+        finally:
+            self._pool.shutdown()
+            for writer in self._writers.values():
+                writer.shutdown()
+            self._pool = None
+            self._writers = {}
+
     def _joblib_execute(self, state: utils.DistributedState,
                         queues: List[List["BackendGate"]]):
         """Executes gates in ``accelerators`` in parallel.
@@ -130,26 +167,40 @@ class DistributedCircuit(circuit.Circuit):
                 number of gates to be applied by accelerator ``i``.
         """
         def device_job(ids, device):
-            for i in ids:
+            if len(ids) == 1:
+                i = ids[0]
                 with K.device(device):
                     piece = self._device_job(state.pieces[i], queues[i])
                     state.pieces[i].assign(piece)
                     del(piece)
+                return
 
-        pool = joblib.Parallel(n_jobs=len(self.calc_devices),
-                               prefer="threads")
-        pool(joblib.delayed(device_job)(ids, device)
-             for device, ids in self.queues.device_to_ids.items())
+            # When a device updates multiple pieces, the copy of each updated
+            # piece back to ``memory_device`` happens in the device writer
+            # thread so that it overlaps with the calculation of the next piece
+            writer = self._writers[device]
+            future = None
+            for i in ids:
+                with K.device(device):
+                    piece = self._device_job(state.pieces[i], queues[i])
+                # wait for the previous piece to be copied so that at most
+                # two pieces are kept in the device at the same time
+                if future is not None:
+                    future.result()
+                future = writer.submit(self._assign_piece, state, device, i, piece)
+                del(piece)
+            future.result()
+
+        futures = [self._pool.submit(device_job, ids, device)
+                   for device, ids in self.queues.device_to_ids.items()]
+        for future in futures:
+            future.result()
 
     def _swap(self, state: utils.DistributedState, global_qubit: int, local_qubit: int):
-        m = self.queues.qubits.reduced_global[global_qubit]
-        m = self.nglobal - m - 1
-        t = 1 << m
-        for g in range(self.ndevices // 2):
-            i = ((g >> m) << (m + 1)) + (g & (t - 1))
-            local_eff = self.queues.qubits.reduced_local[local_qubit]
-            with K.device(self.memory_device):
-                K.op.swap_pieces(state.pieces[i], state.pieces[i + t],
+        local_eff = self.queues.qubits.reduced_local[local_qubit]
+        with K.device(self.memory_device):
+            for i, j in self.queues.qubits.swap_pairs[global_qubit]:
+                K.op.swap_pieces(state.pieces[i], state.pieces[j],
                                  local_eff, self.nlocal, get_threads())
 
     def _normalize(self, state: utils.DistributedState):
@@ -201,18 +252,19 @@ class DistributedCircuit(circuit.Circuit):
             self.measurement_gate.device = self.memory_device
 
         special_gates = iter(self.queues.special_queue)
-        for i, queues in enumerate(self.queues.queues):
-            if queues:  # standard gate
-                self._joblib_execute(state, queues)
-            else: # special gate
-                gate = next(special_gates)
-                if isinstance(gate, tuple): # SWAP global-local qubit
-                    self._swap(state, *gate)
-                elif isinstance(gate, str): # Normalize state (after ``Collapse``)
-                    assert gate == "normalize"
-                    self._normalize(state)
-                else:
-                    self._special_gate_execute(state, gate)
+        with self._executors():
+            for i, queues in enumerate(self.queues.queues):
+                if queues:  # standard gate
+                    self._joblib_execute(state, queues)
+                else: # special gate
+                    gate = next(special_gates)
+                    if isinstance(gate, tuple): # SWAP global-local qubit
+                        self._swap(state, *gate)
+                    elif isinstance(gate, str): # Normalize state (after ``Collapse``)
+                        assert gate == "normalize"
+                        self._normalize(state)
+                    else:
+                        self._special_gate_execute(state, gate)
         for gate in special_gates: # pragma: no cover
             self._special_gate_execute(state, gate)
 
@@ -1,4 +1,4 @@
-import copy
+import collections
 from qibo import K
 from qibo.abstractions import gates
 from qibo.config import raise_error, get_threads
@@ -11,36 +11,60 @@ class DistributedQubits:
     Holds the following data:
     * ``list``: Sorted list with the ids of global qubits.
     * ``set``: Same as ``list`` but in a set to allow O(1) search.
+    * ``mask``: Integer bitmask with the bits of global qubit ids set.
     * ``local``: Sorted list with the ids of local qubits.
     * ``reduced_global``: Map from global qubit ids to their reduced value.
         The reduced value is the effective id in a hypothetical circuit
         that does not contain the local qubits.
     * ``reduced_local``: Map from local qubit ids to their reduced value.
+    * ``reduction``: Array with the number of global qubits that precede
+        each qubit id. Used to calculate reduced ids without looping over
+        the global qubits.
+    * ``swap_pairs``: Map from global qubit ids to the list of piece index
+        pairs ``(i, j)`` that are swapped when this global qubit is swapped
+        with a local qubit.
     * ``transpose_order``: Order of indices used to split a full state vector
         to state pieces.
     * ``reverse_tranpose_order``: Order of indices used to merge state pieces
         to a full state vector.
     """
 
+    __slots__ = ("set", "list", "mask", "local", "reduction", "reduced_global",
+                 "reduced_local", "transpose_order", "reverse_transpose_order",
+                 "swap_pairs")
+
     def __init__(self, qubits: Sequence[int], nqubits: int):
         self.set = set(qubits)
         self.list = sorted(qubits)
+        self.mask = 0
+        for q in self.list:
+            self.mask |= 1 << q
         self.local = [q for q in range(nqubits) if q not in self.set]
+        self.reduction = K.np.searchsorted(self.list, K.np.arange(nqubits),
+                                           side="right")
         self.reduced_global = {q: self.list.index(q) for q in self.list}
-        self.reduced_local = {q: q - self.reduction_number(q)
+        self.reduced_local = {q: q - int(self.reduction[q])
                               for q in self.local}
 
         self.transpose_order = self.list + self.local
-        self.reverse_transpose_order = nqubits * [0]
-        for i, v in enumerate(self.transpose_order):
-            self.reverse_transpose_order[v] = i
+        reverse_transpose_order = K.np.empty(nqubits, dtype=K.np.int64)
+        reverse_transpose_order[self.transpose_order] = K.np.arange(nqubits)
+        self.reverse_transpose_order = reverse_transpose_order.tolist()
+
+        nglobal = len(self.list)
+        self.swap_pairs = {}
+        for q, m in self.reduced_global.items():
+            m = nglobal - m - 1
+            t = 1 << m
+            pairs = []
+            for g in range(2 ** (nglobal - 1)):
+                i = ((g >> m) << (m + 1)) + (g & (t - 1))
+                pairs.append((i, i + t))
+            self.swap_pairs[q] = pairs
 
     def reduction_number(self, q: int) -> int:
         """Calculates the effective id in a circuit without the global qubits."""
-        for i, gq in enumerate(self.list):
-            if gq > q:
-                return i
-        return i + 1
+        return int(self.reduction[q])
 
 
 class DistributedBase:
@@ -54,6 +78,8 @@ class DistributedBase:
     * ``nlocal``: Number of local qubits (= nqubits - nglobal).
     """
 
+    __slots__ = ("circuit",)
+
     def __init__(self, circuit):
         self.circuit = circuit
 
@@ -90,6 +116,7 @@ class DistributedQueues(DistributedBase):
         multiple state pieces. The list of indices specifies which pieces the device
         will update.
     * ``ids_to_device``: Inverse dictionary of ``device_to_ids``.
+    * ``piece_ids``: Array with the indices of all state pieces.
     * ``queues``: Nested list of shape ``(ngroups, ndevices, group size)``.
         For example ``queues[2][1]`` gives the gate queue of the second gate
         group to be run in the first device.
@@ -100,6 +127,14 @@ class DistributedQueues(DistributedBase):
         ``CallbackGate``, ``Flatten`` or SWAPs between local and global qubits.
     """
 
+    __slots__ = ("gate_module", "queues", "special_queue", "qubits",
+                 "swaps_list", "piece_ids", "device_to_ids", "ids_to_device")
+
+    # Transformations of previously seen gate queues, keyed by the queue
+    # structure, so that circuits with the same gates skip ``_transform``
+    _transform_cache = collections.OrderedDict()
+    _transform_cache_size = 32
+
     def __init__(self, circuit, gate_module):
         super(DistributedQueues, self).__init__(circuit)
         self.gate_module = gate_module
@@ -111,6 +146,10 @@ class DistributedQueues(DistributedBase):
         # in the end
         self.swaps_list = []
 
+        # Piece indices used to find which pieces are affected by gates
+        # with global control qubits
+        self.piece_ids = K.np.arange(self.ndevices)
+
         self.device_to_ids = {d: v for d, v in self._ids(circuit.calc_devices)}
         self.ids_to_device = self.ndevices * [None]
         for device, ids in self.device_to_ids.items():
@@ -137,10 +176,10 @@ class DistributedQueues(DistributedBase):
 
         counter = self.count(queue, self.nqubits)
         if self.qubits is None:
-            self.qubits = DistributedQubits(counter.argsort()[:self.nglobal],
+            self.qubits = DistributedQubits(K.np.argsort(counter)[:self.nglobal],
                                             self.nqubits)
         transformed_queue = self.transform(queue, counter)
-        self.create(transformed_queue)
+        self.create(self.fuse(transformed_queue))
 
     def _ids(self, calc_devices: Dict[str, int]) -> Tuple[str, List[int]]:
         """Generator of device piece indices."""
@@ -150,27 +189,66 @@ class DistributedQueues(DistributedBase):
             yield device, list(range(start, stop))
             start = stop
 
-    def _create_device_gate(self, gate: gates.Gate) -> gates.Gate:
-        """Creates a copy of a gate for specific device application.
+    def _reduced_qubits(self, gate: gates.Gate) -> Tuple[Tuple[int], Tuple[int]]:
+        """Calculates the target and control ids of a gate for device application.
 
         Target and control qubits are modified according to the local qubits of
-        the circuit when this gate will be applied.
+        the circuit when this gate will be applied. Global control qubits are
+        removed as they are taken into account by ``_piece_flags``.
+
+        Args:
+            gate: The :class:`qibo.abstractions.gates.Gate` object to reduce.
+
+        Returns:
+            Tuples with the reduced target and control qubit ids.
+        """
+        reduction = self.qubits.reduction
+        targets = K.np.array(gate.target_qubits, dtype=K.np.int64)
+        mask = self.qubits.mask
+        controls = K.np.array([q for q in gate.control_qubits
+                               if not (mask >> q) & 1], dtype=K.np.int64)
+        target_qubits = tuple((targets - reduction[targets]).tolist())
+        control_qubits = tuple((controls - reduction[controls]).tolist())
+        return target_qubits, control_qubits
+
+    def _piece_flags(self, gate: gates.Gate):
+        """Finds which state pieces the given gate should be applied to.
+
+        If there are control qubits that are global then the gate should not
+        be applied by all devices.
+
+        Returns:
+            Boolean array of shape ``(ndevices,)`` that is ``True`` for the
+            piece indices that the gate should be applied to.
+        """
+        # bits of the piece index that must be set for the gate to be applied
+        mask = self.qubits.mask
+        piece_mask = 0
+        for control in gate.control_qubits:
+            if (mask >> control) & 1:
+                ic = self.nglobal - self.qubits.reduced_global[control] - 1
+                piece_mask |= 1 << ic
+        return (self.piece_ids & piece_mask) == piece_mask
+
+    def _create_device_gate(self, gate: gates.Gate,
+                            target_qubits: Tuple[int],
+                            control_qubits: Tuple[int]) -> gates.Gate:
+        """Creates a copy of a gate for specific device application.
 
         Args:
             gate: The :class:`qibo.abstractions.gates.Gate` object of the gate to copy.
+            target_qubits: Reduced target qubit ids calculated by ``_reduced_qubits``.
+            control_qubits: Reduced control qubit ids calculated by ``_reduced_qubits``.
 
         Returns:
             A :class:`qibo.abstractions.gates.Gate` object with the proper target and
             control qubit indices for device-specific application.
         """
-        devgate = copy.copy(gate)
-        # Recompute the target/control indices considering only local qubits.
-        new_target_qubits = tuple(q - self.qubits.reduction_number(q)
-                                  for q in devgate.target_qubits)
-        new_control_qubits = tuple(q - self.qubits.reduction_number(q)
-                                   for q in devgate.control_qubits
-                                   if q not in self.qubits.set)
-        devgate.set_targets_and_controls(new_target_qubits, new_control_qubits)
+        # Shallow clone that bypasses the ``copy.copy`` reduce protocol,
+        # as this is called once per gate and device group
+        devgate = gate.__class__.__new__(gate.__class__)
+        devgate.__dict__.update(gate.__dict__)
+        devgate.set_targets_and_controls(target_qubits, control_qubits)
         devgate.original_gate = gate
         devgate.device_gates = set()
         return devgate
@@ -187,40 +265,69 @@ class DistributedQueues(DistributedBase):
             Array of integers with shape (nqubits,) with the number of gates
             for each qubit id.
         """
-        counter = K.np.zeros(nqubits, dtype=K.np.int64)
-        for gate in queue:
-            for qubit in gate.target_qubits:
-                counter[qubit] += 1
-        return counter
+        targets = K.np.fromiter((q for gate in queue
+                                 for q in gate.target_qubits),
+                                dtype=K.np.int64)
+        return K.np.bincount(targets, minlength=nqubits)
 
-    def _transform(self, queue: List[gates.Gate],
-                   remaining_queue: List[gates.Gate],
-                   counter) -> List[gates.Gate]:
-        """Helper recursive method for ``transform``."""
-        new_remaining_queue = []
+    def _sweep(self, queue: List[gates.Gate],
+               remaining_queue: List[gates.Gate],
+               counter: List[int]) -> List[gates.Gate]:
+        """Moves the gates that can be applied without swaps to ``queue``.
+
+        A gate is moved if it does not target global qubits and commutes with
+        all the gates that were skipped before it. Skipped gates are indexed
+        by the qubits they act on so that commutation is checked only against
+        skipped gates that share qubits with the current gate.
+
+        Returns:
+            List with the gates that were skipped.
+        """
+        global_set = self.qubits.set
+        swaps_list = self.swaps_list
+        skipped = []
+        skipped_special = False
+        skipped_on_qubit = {}
         for gate in remaining_queue:
-            if isinstance(gate, gates.SpecialGate):
-                gate.swap_reset = list(self.swaps_list)
-
-            global_targets = set(gate.target_qubits) & self.qubits.set
-            accept = isinstance(gate, gates.SWAP) and len(global_targets) == 1
-            accept = accept or not global_targets
-            for skipped_gate in new_remaining_queue:
-                accept = accept and skipped_gate.commutes(gate)
-                if not accept:
-                    break
+            is_special = isinstance(gate, gates.SpecialGate)
+            if is_special:
+                gate.swap_reset = list(swaps_list)
+
+            # ``isdisjoint`` avoids creating a set for gates without global
+            # targets, which are the majority
+            if global_set.isdisjoint(gate.target_qubits):
+                accept = True
+            else:
+                accept = (isinstance(gate, gates.SWAP) and
+                          len(global_set.intersection(gate.target_qubits)) == 1)
+            qubits = gate.qubits
+            if accept and skipped:
+                if is_special or skipped_special:
+                    accept = False
+                else:
+                    accept = all(skipped_gate.commutes(gate)
+                                 for q in qubits
+                                 for skipped_gate in skipped_on_qubit.get(q, ()))
             if accept:
                 queue.append(gate)
                 for q in gate.target_qubits:
                     counter[q] -= 1
             else:
-                new_remaining_queue.append(gate)
-
-        if not new_remaining_queue:
-            return queue
-
-        # Find which qubits to swap
-        gate = new_remaining_queue[0]
+                skipped.append(gate)
+                skipped_special = skipped_special or is_special
+                for q in qubits:
+                    skipped_on_qubit.setdefault(q, []).append(gate)
+        return skipped
+
+    def _swap_global(self, queue: List[gates.Gate],
+                     remaining_queue: List[gates.Gate], counter: List[int]):
+        """Adds the SWAPs required to apply the first gate of ``remaining_queue``.
+
+        The global targets of the first remaining gate are swapped with the
+        local qubits that are targeted by the fewest gates. The remaining gates
+        are modified in place to take into account the swaps.
+        """
+        gate = remaining_queue[0]
         target_set = set(gate.target_qubits)
         global_targets = target_set & self.qubits.set
         if isinstance(gate, gates.SWAP): # pragma: no cover
@@ -228,8 +335,9 @@ class DistributedQueues(DistributedBase):
             assert len(global_targets) == 2
             global_targets.remove(target_set.pop())
 
-        available_swaps = (q for q in counter.argsort()
-                           if q not in self.qubits.set | target_set)
+        excluded = self.qubits.set | target_set
+        available_swaps = (q for q in K.np.argsort(counter)
+                           if q not in excluded)
         qubit_map = {}
         for q in global_targets:
             qs = next(available_swaps)
@@ -244,14 +352,30 @@ class DistributedQueues(DistributedBase):
             counter[q], counter[qs] = counter[qs], counter[q]
 
         # Modify gates to take into account the swaps
-        for gate in new_remaining_queue:
+        swapped = set(qubit_map)
+        for gate in remaining_queue:
+            if swapped.isdisjoint(gate.qubits):
+                continue
             new_target_qubits = tuple(qubit_map[q] if q in qubit_map else q
                                        for q in gate.target_qubits)
             new_control_qubits = tuple(qubit_map[q] if q in qubit_map else q
                                         for q in gate.control_qubits)
             gate.set_targets_and_controls(new_target_qubits, new_control_qubits)
 
-        return self._transform(queue, new_remaining_queue, counter)
+    def _transform(self, queue: List[gates.Gate],
+                   remaining_queue: List[gates.Gate],
+                   counter: List[int]) -> List[gates.Gate]:
+        """Helper method for ``transform``.
+
+        Alternates between sweeping the remaining gates (see ``_sweep``) and
+        adding global-local SWAPs (see ``_swap_global``) until all gates
+        are moved to ``queue``.
+        """
+        remaining_queue = self._sweep(queue, remaining_queue, counter)
+        while remaining_queue:
+            self._swap_global(queue, remaining_queue, counter)
+            remaining_queue = self._sweep(queue, remaining_queue, counter)
+        return queue
 
     def transform(self, queue, counter=None):
         """Transforms gate queue to be compatible with distributed simulation.
@@ -271,11 +395,114 @@ class DistributedQueues(DistributedBase):
         """
         if counter is None:
             counter = self.count(queue, self.nqubits)
-        new_queue = self._transform([], queue, counter)
+        # Use a list of Python ints because ``counter`` is updated for
+        # every gate during the transformation
+        counter = K.np.asarray(counter).tolist()
+
+        # The transformation depends only on the gate types and qubits
+        key = (self.nqubits, tuple(self.qubits.list), tuple(self.swaps_list),
+               tuple(counter), tuple((gate.__class__, gate.target_qubits,
+                                      gate.control_qubits) for gate in queue))
+        plan = self._transform_cache.get(key)
+        if plan is None:
+            new_queue = self._transform([], queue, counter)
+            self._transform_cache[key] = self._transform_plan(queue, new_queue)
+            if len(self._transform_cache) > self._transform_cache_size:
+                self._transform_cache.popitem(last=False)
+        else:
+            self._transform_cache.move_to_end(key)
+            new_queue = self._replay_transform(queue, plan)
         new_queue.extend((self.gate_module.SWAP(*p)
                           for p in reversed(self.swaps_list)))
         return new_queue
 
+    def _transform_plan(self, queue: List[gates.Gate],
+                        new_queue: List[gates.Gate]):
+        """Records the result of ``_transform`` so that it can be replayed.
+
+        Returns:
+            Tuple with a list that holds, for each gate of ``new_queue``, its
+            index in ``queue`` (``None`` for added SWAPs), its final target and
+            control qubits and its ``swap_reset`` list (for special gates), and
+            the final ``swaps_list``.
+        """
+        index = {id(gate): i for i, gate in enumerate(queue)}
+        entries = []
+        for gate in new_queue:
+            swap_reset = None
+            if isinstance(gate, gates.SpecialGate):
+                swap_reset = tuple(gate.swap_reset)
+            entries.append((index.get(id(gate)), gate.target_qubits,
+                            gate.control_qubits, swap_reset))
+        return entries, tuple(self.swaps_list)
+
+    def _replay_transform(self, queue: List[gates.Gate], plan):
+        """Applies a plan created by ``_transform_plan`` to ``queue``."""
+        entries, swaps_list = plan
+        new_queue = []
+        for i, target_qubits, control_qubits, swap_reset in entries:
+            if i is None:
+                new_queue.append(self.gate_module.SWAP(*target_qubits))
+                continue
+            gate = queue[i]
+            if (gate.target_qubits != target_qubits or
+                    gate.control_qubits != control_qubits):
+                gate.set_targets_and_controls(target_qubits, control_qubits)
+            if swap_reset is not None:
+                gate.swap_reset = list(swap_reset)
+            new_queue.append(gate)
+        self.swaps_list = list(swaps_list)
+        return new_queue
+
+    @staticmethod
+    def _is_fusable(gate: gates.Gate) -> bool:
+        """Checks if a gate can be fused by ``fuse``."""
+        return (len(gate.target_qubits) == 1 and not gate.control_qubits and
+                not isinstance(gate, (gates.ParametrizedGate, gates.Collapse)))
+
+    def fuse(self, queue: List[gates.Gate]) -> List[gates.Gate]:
+        """Fuses consecutive one-qubit gates that act on the same qubit.
+
+        Each run of such gates is replaced by a single ``Unitary`` gate
+        so that the corresponding state piece is updated once instead of
+        once per gate. A run is interrupted by any other gate that acts on
+        its qubit. Parametrized and controlled gates are not fused.
+
+        Args:
+            queue (list): List of gates compatible with distributed run.
+
+        Returns:
+            List of gates with the same effect as ``queue``.
+        """
+        groups = []
+        # map from qubit id to the index of the open run in ``groups``
+        runs = {}
+        for gate in queue:
+            if self._is_fusable(gate):
+                q = gate.target_qubits[0]
+                if q in runs:
+                    groups[runs[q]].append(gate)
+                    continue
+                runs[q] = len(groups)
+            elif not gate.target_qubits: # special gate
+                runs.clear()
+            else:
+                for q in gate.qubits:
+                    runs.pop(q, None)
+            groups.append([gate])
+
+        new_queue = []
+        for group in groups:
+            if len(group) == 1:
+                new_queue.append(group[0])
+            else:
+                matrix = group[0].unitary
+                for gate in group[1:]:
+                    matrix = gate.unitary @ matrix
+                new_queue.append(self.gate_module.Unitary(
+                    matrix, *group[0].target_qubits, trainable=False))
+        return new_queue
+
     def create(self, queue: List[gates.Gate]):
         """Creates the queues for each accelerator device.
 
@@ -284,6 +511,8 @@ class DistributedQueues(DistributedBase):
             If the original ``queue`` contains gates that target global qubits
             then ``transform` should be used to obtain a compatible queue.
         """
+        global_set = self.qubits.set
+        nlocal = self.nlocal
         for gate in queue:
             is_collapse = isinstance(gate, gates.Collapse)
 
@@ -293,8 +522,8 @@ class DistributedQueues(DistributedBase):
                 self.special_queue.append(gate)
                 self.queues.append([])
 
-            elif set(gate.target_qubits) & self.qubits.set: # global swap gate
-                global_qubits = set(gate.target_qubits) & self.qubits.set
+            elif not global_set.isdisjoint(gate.target_qubits): # global swap gate
+                global_qubits = global_set.intersection(gate.target_qubits)
                 if not isinstance(gate, gates.SWAP):
                     raise_error(ValueError, "Only SWAP gates are supported for "
                                             "global qubits.")
@@ -313,12 +542,20 @@ class DistributedQueues(DistributedBase):
                 if not self.queues or not self.queues[-1]:
                     self.queues.append([[] for _ in range(self.ndevices)])
 
+                # Reduced qubit ids and the pieces that the gate is applied to
+                # are the same for all devices so they are calculated once
+                target_qubits, control_qubits = self._reduced_qubits(gate)
+                flags = self._piece_flags(gate)
                 for device, ids in self.device_to_ids.items():
-                    devgate = self._create_device_gate(gate)
+                    ids = [i for i in ids if flags[i]]
+                    if not ids:
+                        continue
+                    devgate = self._create_device_gate(gate, target_qubits,
+                                                       control_qubits)
                     # Gate matrix should be constructed in the calculation
                     # device otherwise device parallelization will break
                     devgate.device = device
-                    devgate.nqubits = self.nlocal
+                    devgate.nqubits = nlocal
                     devgate.prepare()
                     if is_collapse:
                         # For ``Collapse`` gates we have to skip the
@@ -326,20 +563,9 @@ class DistributedQueues(DistributedBase):
                         devgate.normalize = False
 
                     for i in ids:
-                        flag = True
-                        # If there are control qubits that are global then
-                        # the gate should not be applied by all devices
-                        for control in (set(gate.control_qubits) &
-                                        self.qubits.set):
-                            ic = self.qubits.list.index(control)
-                            ic = self.nglobal - ic - 1
-                            flag = bool((i // (2 ** ic)) % 2)
-                            if not flag:
-                                break
-                        if flag:
-                            self.queues[-1][i].append(devgate)
-                            if isinstance(gate, gates.ParametrizedGate):
-                                gate.device_gates.add(devgate)
+                        self.queues[-1][i].append(devgate)
+                    if isinstance(gate, gates.ParametrizedGate):
+                        gate.device_gates.add(devgate)
 
             if is_collapse:
                 # and normalize  the full state on CPU by adding a
@@ -370,6 +596,8 @@ class DistributedState(DistributedBase):
       ``DistributedQueues`` of the circuit.
     * self.shapes: Dictionary containing tensors that are useful for reshaping
       the state when splitting/merging the pieces.
+    * self.merge_axis: Axis along which the pieces are stacked to obtain
+      the full state vector, or ``None`` if the transpose op is needed.
     """
 
     def __init__(self, circuit: "DistributedCircuit"):
@@ -395,6 +623,15 @@ class DistributedState(DistributedBase):
             "local": 2 ** K.np.arange(self.nlocal - 1, -1, -1)
             }
 
+        # If global qubits are the first or the last qubits, the full state
+        # vector can be obtained by stacking the pieces along this axis
+        if self.qubits.list == list(range(self.nglobal)):
+            self.merge_axis = 0
+        elif self.qubits.list == list(range(self.nlocal, self.nqubits)):
+            self.merge_axis = 1
+        else:
+            self.merge_axis = None
+
     @classmethod
     def default(cls, circuit: "DistributedCircuit"):
       """Creates the |000...0> state for default initialization."""
@@ -428,6 +665,21 @@ class DistributedState(DistributedBase):
             full_state (array): Full state vector as a tensor of shape
                 ``(2 ** nqubits)``.
         """
+        if self.merge_axis is not None:
+            # pieces are slices of the full state so they can be assigned
+            # without transposing to an intermediate full state copy
+            with K.device(self.device):
+                if self.merge_axis == 0:
+                    full_state = K.reshape(full_state, self.shapes["device"])
+                    for i in range(self.ndevices):
+                        self.pieces[i].assign(full_state[i])
+                else:
+                    shape = (2 ** self.nlocal, self.ndevices)
+                    full_state = K.reshape(full_state, shape)
+                    for i in range(self.ndevices):
+                        self.pieces[i].assign(full_state[:, i])
+            return
+
         with K.device(self.device):
             full_state = K.reshape(full_state, self.shapes["device"])
             pieces = [full_state[i] for i in range(self.ndevices)]
@@ -445,13 +697,9 @@ class DistributedState(DistributedBase):
         This is done by merging the state pieces to a single tensor.
         Using this method will double memory usage.
         """
-        if self.qubits.list == list(range(self.nglobal)):
-            with K.device(self.device):
-                state = K.concatenate([x[K.newaxis] for x in self.pieces], axis=0)
-                state = K.reshape(state, self.shapes["full"])
-        elif self.qubits.list == list(range(self.nlocal, self.nqubits)):
+        if self.merge_axis is not None:
             with K.device(self.device):
-                state = K.concatenate([x[:, K.newaxis] for x in self.pieces], axis=1)
+                state = K.stack(self.pieces, axis=self.merge_axis)
                 state = K.reshape(state, self.shapes["full"])
         else: # fall back to the transpose op
             with K.device(self.device):
@@ -23,6 +23,15 @@ def pytest_configure(config):
     )
 
 
+@pytest.fixture(scope="session", autouse=True)
+def backend_warmup():
+    """Executes a small circuit to pay the backend initialization cost once."""
+    from qibo import gates, models
+    c = models.Circuit(1)
+    c.add(gates.H(0))
+    c()
+
+
 def pytest_generate_tests(metafunc):
     import qibo
     qibo.set_backend("custom")
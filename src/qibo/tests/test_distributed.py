@@ -1,4 +1,5 @@
 # pylint: disable=E1101
+import collections
 import pytest
 import numpy as np
 import qibo
@@ -32,6 +33,33 @@ def test_ndevices():
     assert c.nglobal == 2
 
 
+@pytest.mark.parametrize("global_qubits", [[0], [2, 3], [1, 4, 5]])
+def test_distributed_qubits_reduction(global_qubits):
+    """Check reduced qubit ids calculated by ``DistributedQubits``."""
+    qubits = distutils.DistributedQubits(global_qubits, 6)
+    assert qubits.mask == sum(2 ** q for q in global_qubits)
+    for q in range(6):
+        target = len([gq for gq in global_qubits if gq <= q])
+        assert qubits.reduction[q] == target
+        assert qubits.reduction_number(q) == target
+    for q in qubits.local:
+        assert qubits.reduced_local[q] == qubits.local.index(q)
+
+
+@pytest.mark.parametrize("global_qubits", [[0, 2], [1, 3, 5], [0, 1, 2, 3]])
+def test_distributed_qubits_swap_pairs(global_qubits):
+    """Check that swapped pieces differ only in the swapped global qubit."""
+    nglobal = len(global_qubits)
+    qubits = distutils.DistributedQubits(global_qubits, 6)
+    for q in global_qubits:
+        bit = 1 << (nglobal - qubits.reduced_global[q] - 1)
+        pairs = qubits.swap_pairs[q]
+        assert len(pairs) == 2 ** (nglobal - 1)
+        for i, j in pairs:
+            assert i & bit == 0
+            assert j == i + bit
+
+
 def test_transform_queue_simple():
     original_backend = qibo.get_backend()
     qibo.set_backend("custom")
@@ -91,6 +119,81 @@ def test_transform_queue_more_gates():
     qibo.set_backend(original_backend)
 
 
+def test_transform_queue_cache(monkeypatch):
+    """Check that transforming the same gate structure twice replays the cache."""
+    original_backend = qibo.get_backend()
+    qibo.set_backend("custom")
+    monkeypatch.setattr(distutils.DistributedQueues, "_transform_cache",
+                        collections.OrderedDict())
+    tqueues = []
+    for repeat in range(2):
+        c = models.Circuit(4, {"/GPU:0": 2, "/GPU:1": 2})
+        c.add((gates.H(i) for i in range(4)))
+        c.add((gates.CNOT(i, i + 1) for i in range(3)))
+        c.add(gates.RX(0, theta=0.1))
+        c.queues.qubits = distutils.DistributedQubits([2, 3], c.nqubits)
+        key = (4, (2, 3), (), tuple(c.queues.count(c.queue, 4).tolist()),
+               tuple((gate.__class__, gate.target_qubits, gate.control_qubits)
+                     for gate in c.queue))
+        if repeat:
+            # the second transformation should not run ``_transform``
+            def _transform(*args): # pragma: no cover
+                raise AssertionError("Transformation was not cached.")
+            monkeypatch.setattr(distutils.DistributedQueues, "_transform",
+                                _transform)
+        tqueue = c.queues.transform(c.queue)
+        assert list(distutils.DistributedQueues._transform_cache) == [key]
+        for gate in tqueue:
+            assert isinstance(gate, gates.SWAP) or gate in c.queue
+        tqueues.append(tqueue)
+    assert len(tqueues[0]) == len(tqueues[1])
+    for gate1, gate2 in zip(*tqueues):
+        assert gate1.__class__ == gate2.__class__
+        assert gate1.target_qubits == gate2.target_qubits
+        assert gate1.control_qubits == gate2.control_qubits
+    qibo.set_backend(original_backend)
+
+
+def test_transform_queue_deep_circuit():
+    """Check that transforming circuits that require many SWAPs does not recurse."""
+    original_backend = qibo.get_backend()
+    qibo.set_backend("custom")
+    c = models.Circuit(3, {"/GPU:0": 2})
+    for _ in range(520):
+        c.add((gates.CNOT(i, (i + 1) % 3) for i in range(3)))
+    c.queues.qubits = distutils.DistributedQubits([0], c.nqubits)
+    tqueue = c.queues.transform(c.queue)
+    assert len(c.queues.swaps_list) > 1000
+    for gate in tqueue:
+        if not isinstance(gate, gates.SWAP):
+            assert 0 not in gate.target_qubits
+    qibo.set_backend(original_backend)
+
+
+def test_fuse_queue():
+    original_backend = qibo.get_backend()
+    qibo.set_backend("custom")
+    c = models.Circuit(4, {"/GPU:0": 2})
+    c.add([gates.H(0), gates.X(0), gates.H(1), gates.CNOT(0, 1)])
+    c.add([gates.Y(1), gates.Z(1), gates.RX(2, theta=0.1), gates.H(2)])
+    queue = c.queues.fuse(c.queue)
+    assert len(c.queue) == 8
+    assert len(queue) == 6
+    assert isinstance(queue[0], gates.Unitary)
+    assert queue[0].target_qubits == (0,)
+    np.testing.assert_allclose(queue[0].parameters,
+                               qibo.matrices.X @ qibo.matrices.H)
+    assert queue[1] is c.queue[2]
+    assert queue[2] is c.queue[3]
+    assert isinstance(queue[3], gates.Unitary)
+    assert queue[3].target_qubits == (1,)
+    np.testing.assert_allclose(queue[3].parameters,
+                               qibo.matrices.Z @ qibo.matrices.Y)
+    assert queue[4] is c.queue[6]
+    assert queue[5] is c.queue[7]
+    qibo.set_backend(original_backend)
+
+
 def test_set_gates_simple():
     devices = {"/GPU:0": 2, "/GPU:1": 2}
     c = models.Circuit(6, devices)
@@ -175,6 +278,60 @@ def test_user_initialization(nqubits):
         np.testing.assert_allclose(target_piece.ravel(), piece)
 
 
+@pytest.mark.parametrize("global_qubits", [[0, 1], [4, 5], [1, 3]])
+def test_user_initialization_global_qubits(global_qubits):
+    import itertools
+    target_state = utils.random_numpy_state(6)
+
+    devices = {"/GPU:0": 2, "/GPU:1": 2}
+    c = models.Circuit(6, devices)
+    c.queues.qubits = distutils.DistributedQubits(global_qubits, c.nqubits)
+    state = c.get_initial_state(target_state)
+    np.testing.assert_allclose(state.numpy(), target_state)
+
+    local_qubits = [q for q in range(6) if q not in global_qubits]
+    target_state = target_state.reshape(6 * (2,))
+    target_state = np.transpose(target_state, global_qubits + local_qubits)
+    for i, s in enumerate(itertools.product([0, 1], repeat=c.nglobal)):
+        piece = state.pieces[i].numpy()
+        np.testing.assert_allclose(target_state[s].ravel(), piece)
+
+
+@pytest.mark.parametrize("global_qubits", [[0, 1], [4, 5], [1, 3]])
+def test_distributed_measurement_probabilities(global_qubits):
+    """Check that measurement probabilities are calculated without merging pieces."""
+    target_state = utils.random_numpy_state(6)
+    c = models.Circuit(6, {"/GPU:0": 2, "/GPU:1": 2})
+    c.queues.qubits = distutils.DistributedQubits(global_qubits, c.nqubits)
+    state = c.get_initial_state(target_state)
+    mgate = gates.M(4, 0, 3)
+    mgate.nqubits = c.nqubits
+    mgate.prepare()
+    probs = mgate.distributed_call(state)
+    target_probs = mgate.state_vector_call(target_state)
+    np.testing.assert_allclose(probs, target_probs)
+
+
+@pytest.mark.parametrize("precision", ["single", "double"])
+def test_distributed_state_precision(precision):
+    """Check that state pieces follow the precision set by the user."""
+    original_precision = qibo.get_precision()
+    qibo.set_precision(precision)
+    if precision == "single":
+        expected_dtype = qibo.K.backend.complex64
+    else:
+        expected_dtype = qibo.K.backend.complex128
+    devices = {"/GPU:0": 2, "/GPU:1": 2}
+    c = models.Circuit(6, devices)
+    c.queues.qubits = distutils.DistributedQubits(range(c.nglobal), c.nqubits)
+    for initial_state in [None, utils.random_numpy_state(c.nqubits)]:
+        state = c.get_initial_state(initial_state)
+        assert state.dtype == expected_dtype
+        for piece in state.pieces:
+            assert piece.dtype == expected_dtype
+    qibo.set_precision(original_precision)
+
+
 def test_distributed_circuit_errors():
     devices = {"/GPU:0": 2, "/GPU:1": 2}
     c = models.Circuit(6, devices)
@@ -234,6 +391,21 @@ def test_simple_execution(ndevices):
     qibo.set_backend(original_backend)
 
 
+def test_execution_assign_error():
+    """Check that errors when copying pieces back to memory reach the caller."""
+    class FailingPiece:
+        def assign(self, piece):
+            raise ValueError("Cannot assign piece.")
+
+    class FakeState:
+        pieces = [FailingPiece() for _ in range(4)]
+
+    c = models.Circuit(4, {"/GPU:0": 2, "/GPU:1": 2})
+    with c._executors():
+        with pytest.raises(ValueError):
+            c._joblib_execute(FakeState(), [[], [], [], []])
+
+
 @pytest.mark.parametrize("ndevices", [2, 4])
 def test_execution_pretransformed_circuit(ndevices):
     original_backend = qibo.get_backend()
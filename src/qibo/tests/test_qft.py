@@ -1,14 +1,34 @@
 """
 Testing Quantum Fourier Transform (QFT) circuit.
 """
+import functools
 import numpy as np
 import pytest
+from scipy import fft
 from qibo import gates, models
-from qibo.tests import utils
 
 _atol = 1e-7
 
 
+def _fast_allclose(actual, desired, atol=0, rtol=1e-7):
+    """Same as ``np.testing.assert_allclose`` but skips the diagnostics on success.
+
+    Arrays of different shapes are always passed to ``assert_allclose`` so
+    that shape mismatches are not hidden by broadcasting.
+    """
+    actual, desired = np.asarray(actual), np.asarray(desired)
+    if (actual.shape != desired.shape or
+            not np.allclose(actual, desired, atol=atol, rtol=rtol)):
+        np.testing.assert_allclose(actual, desired, atol=atol, rtol=rtol)
+
+
+def _asnumpy(state):
+    """Converts a backend state to a numpy array without copying numpy states."""
+    if isinstance(state, np.ndarray):
+        return state
+    return state.numpy()
+
+
 def qft_matrix(dimension: int, inverse: bool = False) -> np.ndarray:
     """Creates exact QFT matrix.
 
@@ -25,9 +45,54 @@ def qft_matrix(dimension: int, inverse: bool = False) -> np.ndarray:
 
 
 def exact_qft(x: np.ndarray, inverse: bool = False) -> np.ndarray:
-    """Performs exact QFT to a given state vector."""
-    dim = len(x)
-    return qft_matrix(dim, inverse).dot(x) / np.sqrt(dim)
+    """Performs exact QFT to a given state vector.
+
+    The QFT matrix has elements ``exp(2 pi i jk / d) / sqrt(d)`` which
+    corresponds to the normalized inverse FFT. States given as tensors of
+    shape ``nqubits * (2,)`` are transformed as flat vectors and returned
+    with the same shape. Note that ``fftn`` over the qubit axes would apply
+    a two-point DFT to each qubit instead of the QFT.
+    """
+    vector = np.reshape(x, (-1,))
+    if inverse:
+        result = fft.fft(vector, norm="ortho", workers=-1)
+    else:
+        result = fft.ifft(vector, norm="ortho", workers=-1)
+    return np.reshape(result, np.shape(x))
+
+
+def exact_zero_qft(nqubits: int) -> np.ndarray:
+    """Exact QFT of the |00...0> state, which is the uniform superposition."""
+    dim = 2 ** nqubits
+    return np.full(dim, 1.0 / np.sqrt(dim), dtype=np.complex128)
+
+
+@functools.lru_cache(maxsize=None)
+def random_state(nqubits: int):
+    """Creates a seeded random state and its exact QFT once per number of qubits.
+
+    The returned arrays are shared between tests so they are made read-only.
+    """
+    rng = np.random.default_rng(nqubits)
+    state = rng.standard_normal(2 ** nqubits) + 1j * rng.standard_normal(2 ** nqubits)
+    state /= np.sqrt(np.vdot(state, state).real)
+    exact_state = exact_qft(state)
+    state.flags.writeable = False
+    exact_state.flags.writeable = False
+    return state, exact_state
+
+
+@pytest.mark.parametrize("nqubits", [2, 4, 6])
+@pytest.mark.parametrize("inverse", [False, True])
+def test_exact_qft(nqubits, inverse):
+    """Check that the FFT based ``exact_qft`` agrees with the QFT matrix."""
+    initial_state, _ = random_state(nqubits)
+    target_state = qft_matrix(2 ** nqubits, inverse).dot(initial_state)
+    target_state /= np.sqrt(2 ** nqubits)
+    _fast_allclose(exact_qft(initial_state, inverse), target_state, atol=_atol)
+    tensor_state = exact_qft(initial_state.reshape(nqubits * (2,)), inverse)
+    assert tensor_state.shape == nqubits * (2,)
+    _fast_allclose(tensor_state.ravel(), target_state, atol=_atol)
 
 
 def test_qft_sanity():
@@ -41,39 +106,33 @@ def test_qft_sanity():
 def test_qft_transformation(nqubits):
     """Check QFT transformation for |00...0>."""
     c = models.QFT(nqubits)
-    final_state = c.execute().numpy()
-
-    initial_state = np.zeros_like(final_state)
-    initial_state[0] = 1.0
-    exact_state = exact_qft(initial_state)
-
-    np.testing.assert_allclose(final_state, exact_state, atol=_atol)
+    final_state = _asnumpy(c.execute())
+    exact_state = exact_zero_qft(nqubits)
+    _fast_allclose(final_state, exact_state, atol=_atol)
 
 
 @pytest.mark.parametrize("nqubits", [4, 5, 11, 12])
 def test_qft_transformation_random(nqubits):
     """Check QFT transformation for random initial state."""
-    initial_state = utils.random_numpy_state(nqubits)
-    exact_state = exact_qft(initial_state)
+    initial_state, exact_state = random_state(nqubits)
 
-    c_init = models.Circuit(nqubits)
-    c_init.add(gates.Flatten(initial_state))
-    c = c_init + models.QFT(nqubits)
-    final_state = c.execute().numpy()
+    c = models.Circuit(nqubits)
+    c.add(gates.Flatten(initial_state))
+    c.add(models.QFT(nqubits).queue)
+    final_state = _asnumpy(c.execute())
 
-    np.testing.assert_allclose(final_state, exact_state, atol=_atol)
+    _fast_allclose(final_state, exact_state, atol=_atol)
 
 
 @pytest.mark.parametrize("nqubits", [4, 5, 11, 12])
 def test_distributed_qft_agreement(nqubits):
     """Check ``_DistributedQFT`` agrees with normal ``QFT``."""
-    initial_state = utils.random_numpy_state(nqubits)
-    exact_state = exact_qft(initial_state)
+    initial_state, exact_state = random_state(nqubits)
 
     c = models._DistributedQFT(nqubits)
-    final_state = c(np.copy(initial_state)).numpy()
+    final_state = _asnumpy(c(np.copy(initial_state)))
 
-    np.testing.assert_allclose(final_state, exact_state, atol=_atol)
+    _fast_allclose(final_state, exact_state, atol=_atol)
 
 
 def test_distributed_qft_error():
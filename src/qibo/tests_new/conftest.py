@@ -35,6 +35,15 @@ def pytest_configure(config):
     )
 
 
+@pytest.fixture(scope="session", autouse=True)
+def backend_warmup():
+    """Executes a small circuit to pay the backend initialization cost once."""
+    from qibo import gates, models
+    c = models.Circuit(1)
+    c.add(gates.H(0))
+    c()
+
+
 def pytest_addoption(parser):
     parser.addoption("--engines", type=str, default=_ENGINES,
                      help="Backend libaries (eg. numpy, tensorflow, etc.) to test.")
@@ -43,6 +52,7 @@ def pytest_addoption(parser):
     parser.addoption("--accelerators", type=str, default=_ACCELERATORS,
                      help="Accelerator configurations for testing the distributed circuit.")
     # see `_ACCELERATORS` for the string format of the `--accelerators` flag
+    # passing an empty string (`--accelerators ""`) skips distributed circuits
     parser.addoption("--target-backend", type=str, default="numpy",
                      help="Base backend that other backends are tested against.")
     # `test_backends_agreement.py` tests that backend methods agree between
@@ -69,7 +79,7 @@ def pytest_generate_tests(metafunc):
     """
     engines = metafunc.config.option.engines.split(",")
     backends = metafunc.config.option.backends.split(",")
-    accelerators = metafunc.config.option.accelerators
+    accelerators = metafunc.config.option.accelerators or None
     if "tensorflow" not in engines: # pragma: no cover
         # CI uses Tensorflow engine for test execution
         accelerators = None
@@ -10,9 +10,8 @@ from cirq.contrib.qasm_import import circuit_from_qasm, exception
 # Absolute testing tolerance for cirq-qibo comparison
 _atol = 1e-7
 
-
-def test_from_qasm_simple(backend, accelerators):
-    target = f"""OPENQASM 2.0;
+# OpenQASM targets with a Hadamard gate on every qubit
+_QASM_5H = """OPENQASM 2.0;
 include "qelib1.inc";
 qreg q[5];
 h q[0];
@@ -20,96 +19,113 @@ h q[1];
 h q[2];
 h q[3];
 h q[4];"""
+_QASM_2H = """OPENQASM 2.0;
+include "qelib1.inc";
+qreg q[2];
+h q[0];
+h q[1];"""
+
+
+def _fast_allclose(actual, desired, atol=0, rtol=1e-7):
+    """Same as ``np.testing.assert_allclose`` but skips the diagnostics on success.
+
+    Arrays of different shapes are always passed to ``assert_allclose`` so
+    that shape mismatches are not hidden by broadcasting.
+    """
+    actual, desired = np.asarray(actual), np.asarray(desired)
+    if (actual.shape != desired.shape or
+            not np.allclose(actual, desired, atol=atol, rtol=rtol)):
+        np.testing.assert_allclose(actual, desired, atol=atol, rtol=rtol)
+
+
+@pytest.fixture(scope="module")
+def cirq_sim():
+    """Cirq simulator shared by all tests in this module."""
+    return cirq.Simulator()
+
+
+def test_from_qasm_simple(backend, accelerators):
     import qibo
     original_backend = qibo.get_backend()
     qibo.set_backend(backend)
-    c = Circuit.from_qasm(target, accelerators)
+    c = Circuit.from_qasm(_QASM_5H, accelerators)
     assert c.nqubits == 5
     assert c.depth == 1
     for i, gate in enumerate(c.queue):
         assert gate.__class__.__name__ == "H"
         assert gate.qubits == (i,)
     target_state = np.ones(32) / np.sqrt(32)
-    np.testing.assert_allclose(c(), target_state)
+    _fast_allclose(c(), target_state)
     qibo.set_backend(original_backend)
 
 
-def test_simple_cirq():
-    c1 = Circuit(2)
-    c1.add(gates.H(0))
-    c1.add(gates.H(1))
-    final_state_c1 = c1()
-
-    c2 = circuit_from_qasm(c1.to_qasm())
-    c2depth = len(cirq.Circuit(c2.all_operations()))
-    assert c1.depth == c2depth
-    final_state_c2 = cirq.Simulator().simulate(c2).final_state_vector
-    np.testing.assert_allclose(final_state_c1, final_state_c2, atol=_atol)
-
-    c3 = Circuit.from_qasm(c2.to_qasm())
-    assert c3.depth == c2depth
-    final_state_c3 = c3()
-    np.testing.assert_allclose(final_state_c3, final_state_c2, atol=_atol)
-
-
-def test_multiqubit_gates_cirq():
-    c1 = Circuit(2)
-    c1.add(gates.H(0))
-    c1.add(gates.CNOT(0, 1))
-    c1.add(gates.X(1))
-    c1.add(gates.SWAP(0, 1))
-    c1.add(gates.X(0).controlled_by(1))
+def _simple_circuit():
+    c = Circuit(2)
+    c.add(gates.H(0))
+    c.add(gates.H(1))
+    return c
+
+
+def _multiqubit_gates_circuit():
+    c = Circuit(2)
+    c.add(gates.H(0))
+    c.add(gates.CNOT(0, 1))
+    c.add(gates.X(1))
+    c.add(gates.SWAP(0, 1))
+    c.add(gates.X(0).controlled_by(1))
+    return c
+
+
+def _toffoli_circuit():
+    c = Circuit(3)
+    c.add(gates.Y(0))
+    c.add(gates.TOFFOLI(0, 1, 2))
+    c.add(gates.X(1))
+    c.add(gates.TOFFOLI(0, 2, 1))
+    c.add(gates.Z(2))
+    c.add(gates.TOFFOLI(1, 2, 0))
+    return c
+
+
+def _parametrized_gate_circuit():
+    c = Circuit(2)
+    c.add(gates.Y(0))
+    c.add(gates.RY(1, 0.1234))
+    return c
+
+
+def _ugates_circuit():
+    c = Circuit(3)
+    c.add(gates.RX(0, 0.1))
+    c.add(gates.RZ(1, 0.4))
+    c.add(gates.U2(2, 0.5, 0.6))
+    return c
+
+
+@pytest.mark.parametrize("builder,check_depth",
+                         [(_simple_circuit, True),
+                          (_multiqubit_gates_circuit, True),
+                          (_toffoli_circuit, True),
+                          (_parametrized_gate_circuit, False),
+                          (_ugates_circuit, True)])
+def test_cirq_roundtrip(cirq_sim, builder, check_depth):
+    """Check qibo -> cirq -> qibo conversion through OpenQASM."""
+    c1 = builder()
     final_state_c1 = c1()
 
-    c2 = circuit_from_qasm(c1.to_qasm())
-    c2depth = len(cirq.Circuit(c2.all_operations()))
+    qasm1 = c1.to_qasm()
+    c2 = circuit_from_qasm(qasm1)
+    c2depth = len(c2)
     assert c1.depth == c2depth
-    final_state_c2 = cirq.Simulator().simulate(c2).final_state_vector
-    np.testing.assert_allclose(final_state_c1, final_state_c2, atol=_atol)
+    final_state_c2 = cirq_sim.simulate(c2).final_state_vector
+    _fast_allclose(final_state_c1, final_state_c2, atol=_atol)
 
-    c3 = Circuit.from_qasm(c2.to_qasm())
-    assert c3.depth == c2depth
+    qasm2 = c2.to_qasm()
+    c3 = Circuit.from_qasm(qasm2)
+    if check_depth:
+        assert c3.depth == c2depth
     final_state_c3 = c3()
-    np.testing.assert_allclose(final_state_c3, final_state_c2, atol=_atol)
-
-
-def test_toffoli_cirq():
-    c1 = Circuit(3)
-    c1.add(gates.Y(0))
-    c1.add(gates.TOFFOLI(0, 1, 2))
-    c1.add(gates.X(1))
-    c1.add(gates.TOFFOLI(0, 2, 1))
-    c1.add(gates.Z(2))
-    c1.add(gates.TOFFOLI(1, 2, 0))
-    final_state_c1 = c1()
-
-    c2 = circuit_from_qasm(c1.to_qasm())
-    c2depth = len(cirq.Circuit(c2.all_operations()))
-    assert c1.depth == c2depth
-    final_state_c2 = cirq.Simulator().simulate(c2).final_state_vector
-    np.testing.assert_allclose(final_state_c1, final_state_c2, atol=_atol)
-
-    c3 = Circuit.from_qasm(c2.to_qasm())
-    assert c3.depth == c2depth
-    final_state_c3 = c3()
-    np.testing.assert_allclose(final_state_c3, final_state_c2, atol=_atol)
-
-
-def test_parametrized_gate_cirq():
-    c1 = Circuit(2)
-    c1.add(gates.Y(0))
-    c1.add(gates.RY(1, 0.1234))
-    final_state_c1 = c1()
-
-    c2 = circuit_from_qasm(c1.to_qasm())
-    c2depth = len(cirq.Circuit(c2.all_operations()))
-    assert c1.depth == c2depth
-    final_state_c2 = cirq.Simulator().simulate(c2).final_state_vector
-    np.testing.assert_allclose(final_state_c1, final_state_c2, atol=_atol)
-
-    c3 = Circuit.from_qasm(c2.to_qasm())
-    final_state_c3 = c3()
-    np.testing.assert_allclose(final_state_c3, final_state_c2, atol=_atol)
+    _fast_allclose(final_state_c3, final_state_c2, atol=_atol)
 
 
 def test_cu1_cirq():
@@ -122,28 +138,8 @@ def test_cu1_cirq():
         c2 = circuit_from_qasm(c1.to_qasm())
 
 
-def test_ugates_cirq():
-    c1 = Circuit(3)
-    c1.add(gates.RX(0, 0.1))
-    c1.add(gates.RZ(1, 0.4))
-    c1.add(gates.U2(2, 0.5, 0.6))
-    final_state_c1 = c1()
-
-    c2 = circuit_from_qasm(c1.to_qasm())
-    c2depth = len(cirq.Circuit(c2.all_operations()))
-    assert c1.depth == c2depth
-    final_state_c2 = cirq.Simulator().simulate(c2).final_state_vector
-    np.testing.assert_allclose(final_state_c1, final_state_c2, atol=_atol)
-
-    c3 = Circuit.from_qasm(c2.to_qasm())
-    assert c3.depth == c2depth
-    final_state_c3 = c3()
-    np.testing.assert_allclose(final_state_c3, final_state_c2, atol=_atol)
-
-    c1 = Circuit(3)
-    c1.add(gates.RX(0, 0.1))
-    c1.add(gates.RZ(1, 0.4))
-    c1.add(gates.U2(2, 0.5, 0.6))
+def test_cu3_cirq():
+    c1 = _ugates_circuit()
     c1.add(gates.CU3(2, 1, 0.2, 0.3, 0.4))
     # catches unknown gate "cu3"
     with pytest.raises(exception.QasmException):
@@ -162,12 +158,6 @@ def test_crotations_cirq():
 
 
 def test_from_qasm_evaluation():
-    import numpy as np
-    target = f"""OPENQASM 2.0;
-include "qelib1.inc";
-qreg q[2];
-h q[0];
-h q[1];"""
-    c = Circuit.from_qasm(target)
+    c = Circuit.from_qasm(_QASM_2H)
     target_state = np.ones(4) / 2.0
-    np.testing.assert_allclose(c(), target_state)
+    _fast_allclose(c(), target_state)